@@ -1,28 +1,67 @@
-import json
+import mmap
 import os
 import re
-import urllib.parse
+import tempfile
+from collections import OrderedDict
+from functools import lru_cache, partial
 from logging import getLevelName, getLogger
-from typing import Optional, Union
-
-import requests
-from cachecontrol import CacheControl
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Optional,
+    Set,
+    Union,
+)
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore[assignment]
 
 VERSION = "1.3.0"
 
 
+def _get_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _get_umask()
+
+
 class MobFot:
     BASE_URL = "https://www.fotmob.com/api"
     LOGGER = getLogger(__name__)
+    POOL_SIZE = 20
+    QUERY_CACHE_SIZE = 4096
+    MATCH_CACHE_SIZE = 256
+    ZSTD_LEVEL = 3
+    CACHE_SUFFIX = ".json" if zstandard is None else ".json.zst"
+    _DATE_RE = re.compile(r"(20\d{2})(\d{2})(\d{2})")
+    _SEASON_RE = re.compile(r"(20\d{2})/(20\d{2})")
+    _PROCESS_STATE = ("_loads", "_query_cache", "session")
 
     def __init__(
-        self, proxies: Optional[dict] = None, logging_level: Optional[str] = "WARNING"
+        self,
+        proxies: Optional[dict] = None,
+        logging_level: Optional[str] = "WARNING",
+        http2: bool = False,
     ) -> None:
-        SESSION = requests.Session()
-        if proxies:
-            SESSION.proxies.update(proxies)
-        CACHE_SESSION = CacheControl(SESSION)
+        """Creates a FotMob client
 
+        Args:
+            proxies (dict, optional): Proxy URLs by scheme, e.g. `{"https": "http://host:3128"}`. Defaults to None.
+            logging_level (str, optional): The logging level. Defaults to "WARNING".
+            http2 (bool, optional): Use an httpx HTTP/2 client instead of requests. Its errors are `httpx.HTTPError` subclasses rather than `requests.RequestException`, 429/5xx responses are not retried and there is no on-disk HTTP cache. Defaults to False.
+        """
         if logging_level:
             if logging_level.upper() in [
                 "DEBUG",
@@ -35,67 +74,196 @@ class MobFot:
             else:
                 print(f"Logging level {logging_level} not recognized!")
 
-        self.session = CACHE_SESSION
-        self.matches_url = f"{self.BASE_URL}/matches?"
-        self.leagues_url = f"{self.BASE_URL}/leagues?"
-        self.teams_url = f"{self.BASE_URL}/teams?"
-        self.player_url = f"{self.BASE_URL}/playerData?"
-        self.match_details_url = f"{self.BASE_URL}/matchDetails?"
-        self.search_url = f"{self.BASE_URL}/searchData?"
-        self.tv_listing_url = f"{self.BASE_URL}/tvlisting?"
-        self.tv_listings_url = f"{self.BASE_URL}/tvlistings?"
+        self._match_cache: "OrderedDict[Union[int, str], dict]" = OrderedDict()
+        self._cached_match_ids: Optional[Set[int]] = None
         self.DATA_PATH = self._get_data_path()
+        self._cache_prefix = os.fsencode(self.DATA_PATH)
+        self._cache_suffix = os.fsencode(self.CACHE_SUFFIX)
         self._create_data_folder_if_not_exists()
 
+        self.proxies = proxies
+        self.http2 = http2
+        self._setup_process_state()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # Sessions hold sockets and locks, so each process builds its own
+        for attr in self._PROCESS_STATE:
+            del state[attr]
+        # Memoized matches can be large and are also cached on disk
+        state["_match_cache"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._setup_process_state()
+
+    def _setup_process_state(self) -> None:
+        self._loads = self._select_json_loads()
+        self._query_cache = lru_cache(maxsize=self.QUERY_CACHE_SIZE)(
+            lambda path, params: self._execute_query(path, dict(params))
+        )
+        self.session: Union["requests.Session", "httpx.Client"]
+        if self.http2:
+            self.session = self._create_http2_session(self.proxies)
+        else:
+            self.session = self._create_session(self.proxies)
+
+    def _select_json_loads(self) -> Callable[[Union[bytes, memoryview]], Any]:
+        try:
+            from orjson import loads
+
+            return loads
+        except ImportError:
+            pass
+        try:
+            # simdjson returns plain dicts, so it is safe to share across threads
+            from simdjson import loads as backend_loads
+        except ImportError:
+            from json import loads as backend_loads
+
+        def loads_bytes(data: Union[bytes, memoryview]) -> Any:
+            # Unlike orjson, these backends only accept bytes or str
+            return backend_loads(bytes(data))
+
+        return loads_bytes
+
+    def _create_session(self, proxies: Optional[dict]) -> "requests.Session":
+        # Imported here so the HTTP/2 backend never loads requests
+        import requests
+        from cachecontrol import CacheControlAdapter
+        from cachecontrol.caches.file_cache import FileCache
+        from urllib3.util.retry import Retry
+
+        session = requests.Session()
+        if proxies:
+            session.proxies.update(proxies)
+        session.headers.update({"User-Agent": f"mobfot/{VERSION}"})
+        adapter = CacheControlAdapter(
+            FileCache(os.path.join(self.DATA_PATH, "http_cache")),
+            pool_connections=self.POOL_SIZE,
+            pool_maxsize=self.POOL_SIZE,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                raise_on_status=False,
+            ),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _create_http2_session(self, proxies: Optional[dict]) -> "httpx.Client":
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError(
+                "HTTP/2 support requires httpx, install it with `pip install mobfot[http2]`"
+            )
+
+        limits = httpx.Limits(
+            max_keepalive_connections=self.POOL_SIZE, max_connections=50
+        )
+        # httpx only retries failed connections, not 429/5xx responses
+        mounts = None
+        if proxies:
+            mounts = {
+                f"{scheme}://": httpx.HTTPTransport(
+                    proxy=proxy, http2=True, limits=limits, retries=3
+                )
+                for scheme, proxy in proxies.items()
+            }
+        return httpx.Client(
+            transport=httpx.HTTPTransport(http2=True, limits=limits, retries=3),
+            mounts=mounts,
+            follow_redirects=True,
+            headers={"User-Agent": f"mobfot/{VERSION}"},
+        )
+
     def _get_data_path(self):
         if os.name == "nt":  # Windows
-            app_data_folder = os.path.join(os.environ["APPDATA"], "mobfot\\")
+            app_data_folder = os.path.join(os.environ["APPDATA"], "mobfot", "")
             return app_data_folder
         elif os.name == "posix":  # Linux or macOS
             xdg_data = os.getenv("XDG_DATA_HOME")
-            data_folder = "/mobfot/"
             if not xdg_data:
                 raise Exception("XDG_DATA_HOME environment variable is not set.")
-            return xdg_data + data_folder
+            return os.path.join(xdg_data, "mobfot", "")
         else:
             raise NotImplementedError("Unsupported operating system")
 
     def _create_data_folder_if_not_exists(self):
-        try:
-            if not os.path.exists(self.DATA_PATH):
-                os.makedirs(self.DATA_PATH)
-                print(f"Folder '{self.DATA_PATH}' created successfully!")
-        except Exception as e:
-            print(f"Error creating folder: {str(e)}")
-            raise SystemExit
+        os.makedirs(self.DATA_PATH, exist_ok=True)
 
     def _match_is_finished(self, match) -> bool:
-        return (
-            match["header"]["status"]["finished"]
-            and match["header"]["status"]["started"]
-        )
+        status = match["header"]["status"]
+        return status["finished"] and status["started"]
 
-    def _parse_filepath(self, match_id):
-        return self.DATA_PATH + str(match_id) + ".json"
+    def _parse_filepath(self, match_id: Union[int, str]) -> bytes:
+        return self._cache_prefix + b"%d" % int(match_id) + self._cache_suffix
 
-    def _load_if_file_exist(self, filepath: str):
-        if os.path.isfile(filepath):
-            with open(filepath) as file:
-                return json.load(file)
-        else:
+    def _load_if_file_exist(self, filepath: bytes):
+        try:
+            file = open(filepath, "rb")
+        except FileNotFoundError:
             return None
+        with file:
+            if not os.fstat(file.fileno()).st_size:
+                return None
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    if filepath.endswith(b".zst"):
+                        return self._loads(zstandard.decompress(view))
+                    return self._loads(view)
+
+    def _cache_index(self) -> Set[int]:
+        """Lists the cache folder once to learn which matches are cached
+
+        Returns:
+            Set[int]: The IDs of the matches cached on disk
+        """
+        if self._cached_match_ids is None:
+            suffix = self._cache_suffix
+            try:
+                listing = os.listdir(self._cache_prefix)
+            except FileNotFoundError:
+                # A removed data folder is a cache miss, as it was before the index
+                listing = []
+            names = (name[: -len(suffix)] for name in listing if name.endswith(suffix))
+            self._cached_match_ids = {int(name) for name in names if name.isdigit()}
+        return self._cached_match_ids
+
+    def _write_file(self, filepath: bytes, data: bytes) -> None:
+        """Writes to a temporary file first so readers never see a partial file
+
+        Args:
+            filepath (bytes): The destination path, compressed if it ends in .zst
+            data (bytes): The file contents
+        """
+        if filepath.endswith(b".zst"):
+            data = zstandard.compress(data, self.ZSTD_LEVEL)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix=b".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            # mkstemp creates the file as 0600, open() would have honored the umask
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
 
     def _check_date(self, date: str) -> Union[re.Match, None]:
-        """Makes sure dates are formatted correctly YYYY-MM-DD
+        """Makes sure dates are formatted correctly YYYYMMDD
 
         Args:
-            date (str): The date (YYYY-MM-DD)
+            date (str): The date (YYYYMMDD)
 
         Returns:
             Union[re.Match, None]:
         """
-        pattern = re.compile(r"(20\d{2})(\d{2})(\d{2})")
-        return pattern.match(date)
+        return self._DATE_RE.fullmatch(date)
 
     def _check_season(self, season: str) -> Union[re.Match, None]:
         """Makes sure the season is formatted correctly 20WX-20YZ
@@ -106,22 +274,73 @@ class MobFot:
         Returns:
             Union[re.Match, None]:
         """
-        pattern = re.compile(r"(20\d{2})/(20\d{2})")
-        return pattern.match(season)
+        return self._SEASON_RE.fullmatch(season)
 
-    def _execute_query(self, url: str) -> dict:
-        """Executes a single query against the API
+    def _fetch(self, path: str, params: dict, headers: Optional[dict] = None) -> bytes:
+        """Executes a single request against the API
 
         Args:
-            url (str): URL
+            path (str): The endpoint path, relative to BASE_URL
+            params (dict): The query parameters
+            headers (dict, optional): Extra request headers. Defaults to None.
 
         Returns:
-            dict: The response from the API
+            bytes: The raw response body
         """
-        response = self.session.get(url)
+        response = self.session.get(
+            self.BASE_URL + path, params=params, headers=headers
+        )
         response.raise_for_status()
         self.LOGGER.debug(response)
-        return response.json()
+        return response.content
+
+    def _execute_query(self, path: str, params: dict) -> dict:
+        """Executes a single query against the API
+
+        Args:
+            path (str): The endpoint path, relative to BASE_URL
+            params (dict): The query parameters
+
+        Returns:
+            dict: The response from the API
+        """
+        return self._loads(self._fetch(path, params))
+
+    def _execute_cached_query(self, path: str, params: dict) -> dict:
+        """Executes a query, reusing the response of an identical earlier query
+
+        Args:
+            path (str): The endpoint path, relative to BASE_URL
+            params (dict): The query parameters
+
+        Returns:
+            dict: The response from the API, shared with earlier callers
+        """
+        return self._query_cache(path, tuple(params.items()))
+
+    def _remember_match(self, match_id: Union[int, str], match: dict) -> None:
+        """Keeps a finished match in memory, forgetting the least recently used ones
+
+        Args:
+            match_id (Union[int, str]): The match ID
+            match (dict): The match details
+        """
+        # Only single-step operations, so concurrent threads cannot raise KeyError
+        self._match_cache.pop(match_id, None)
+        self._match_cache[match_id] = match
+        while len(self._match_cache) > self.MATCH_CACHE_SIZE:
+            try:
+                self._match_cache.popitem(last=False)
+            except KeyError:
+                break
+
+    def clear_cache(self) -> None:
+        """Forgets all responses memoized in memory by this client
+
+        Match details cached on disk are kept.
+        """
+        self._query_cache.cache_clear()
+        self._match_cache.clear()
 
     def get_matches_by_date(
         self, date: str, time_zone: str = "America/New_York"
@@ -129,15 +348,16 @@ class MobFot:
         """Gets all the matches for a given date
 
         Args:
-            date (str): The date (YYYY-MM-DD)
+            date (str): The date (YYYYMMDD)
             time_zone (str, optional): The time zone. Defaults to "America/New_York".
 
         Returns:
             dict: A dictionary of all the matches for a particular date
         """
         if self._check_date(date) is not None:
-            url = f"{self.matches_url}date={date}&timezone={time_zone}"
-            return self._execute_query(url)
+            return self._execute_query(
+                "/matches", {"date": date, "timezone": time_zone}
+            )
         return {}
 
     def get_league(
@@ -157,11 +377,19 @@ class MobFot:
             time_zone (str, optional): The time zone. Defaults to "America/New_York".
             season (str, optional): The season we want, the format must be `20WX/20YZ`. Defaults to "" (it will show current season)
         Returns:
-            dict: The response from the API
+            dict: The response from the API, shared with later calls, so copy it before modifying it
         """
         if season == "" or self._check_season(season) is not None:
-            url = f"{self.leagues_url}id={id}&tab={tab}&type={type}&timezone={time_zone}&season={season}"
-            return self._execute_query(url)
+            return self._execute_cached_query(
+                "/leagues",
+                {
+                    "id": id,
+                    "tab": tab,
+                    "type": type,
+                    "timezone": time_zone,
+                    "season": season,
+                },
+            )
         return {}
 
     def get_team(
@@ -180,10 +408,11 @@ class MobFot:
             time_zone (str, optional): The time zone. Defaults to "America/New_York".
 
         Returns:
-            dict: The response from the API
+            dict: The response from the API, shared with later calls, so copy it before modifying it
         """
-        url = f"{self.teams_url}id={id}&tab={tab}&type={type}&timezone={time_zone}"
-        return self._execute_query(url)
+        return self._execute_cached_query(
+            "/teams", {"id": id, "tab": tab, "type": type, "timezone": time_zone}
+        )
 
     def get_player(self, id: int) -> dict:
         """Gets information about a given player
@@ -192,35 +421,76 @@ class MobFot:
             id (int): The player ID
 
         Returns:
-            dict: The response from the API
+            dict: The response from the API, shared with later calls, so copy it before modifying it
         """
-        url = f"{self.player_url}id={id}"
-        return self._execute_query(url)
+        return self._execute_cached_query("/playerData", {"id": id})
 
     def get_match_details(self, match_id: int, no_cache: bool = False) -> dict:
         """Gets information about a given match
 
         Args:
             match_id (int): The match ID
+            no_cache (bool, optional): Always query the API, ignoring any cached copy. Defaults to False.
 
         Returns:
-            dict: The response from the API
+            dict: The response from the API, shared with later calls, so copy it before modifying it
         """
-        url = f"{self.match_details_url}matchId={match_id}"
+        # A single lookup, as other threads may evict the match at any time
+        match_details = None if no_cache else self._match_cache.get(match_id)
+        if match_details is not None:
+            self._remember_match(match_id, match_details)
+            return match_details
         filepath = self._parse_filepath(match_id)
-        match_from_cache = self._load_if_file_exist(filepath)
-        if not no_cache and match_from_cache:
+        match_from_cache = None
+        if not no_cache and int(match_id) in self._cache_index():
+            match_from_cache = self._load_if_file_exist(filepath)
+        if match_from_cache:
+            self._remember_match(match_id, match_from_cache)
             return match_from_cache
         else:
-            match_details = self._execute_query(url)
+            # The HTTP cache outlives the client, so it must be bypassed too
+            headers = {"Cache-Control": "no-cache"} if no_cache else None
+            raw = self._fetch("/matchDetails", {"matchId": match_id}, headers=headers)
+            match_details = self._loads(raw)
             if self._match_is_finished(match_details):
+                self._remember_match(match_id, match_details)
                 try:
-                    with open(filepath, "w") as file:
-                        file.write(json.dumps(match_details))
+                    self._write_file(filepath, raw)
+                    self._cache_index().add(int(match_id))
                 except Exception as e:
                     print(f"Error writing to file: {str(e)}")
             return match_details
 
+    def get_match_details_many(
+        self,
+        match_ids: Iterable[int],
+        no_cache: bool = False,
+        max_workers: int = 16,
+    ) -> Dict[int, dict]:
+        """Gets information about several matches concurrently
+
+        Args:
+            match_ids (Iterable[int]): The match IDs
+            no_cache (bool, optional): Always query the API, ignoring any cached copy. Defaults to False.
+            max_workers (int, optional): How many matches to fetch at once, at most POOL_SIZE. Defaults to 16.
+
+        Returns:
+            Dict[int, dict]: The response from the API for each match ID, shared with later calls, so copy it before modifying it
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        match_ids = list(match_ids)
+        # More workers than pooled connections would discard sockets
+        with ThreadPoolExecutor(min(max_workers, self.POOL_SIZE)) as executor:
+            return dict(
+                zip(
+                    match_ids,
+                    executor.map(
+                        partial(self.get_match_details, no_cache=no_cache), match_ids
+                    ),
+                )
+            )
+
     def get_match_tv_listing(self, match_id: int, country_code: str = "GB") -> dict:
         """Gets the TV listing for a given match
 
@@ -231,8 +501,9 @@ class MobFot:
         Returns:
             dict: The response from the API
         """
-        url = f"{self.tv_listing_url}matchId={match_id}&countryCode={country_code}"
-        return self._execute_query(url)
+        return self._execute_query(
+            "/tvlisting", {"matchId": match_id, "countryCode": country_code}
+        )
 
     def get_tv_listings_country(self, country_code: str = "GB") -> dict:
         """Get TV listing information by country
@@ -243,8 +514,7 @@ class MobFot:
         Returns:
             dict: The response from the API
         """
-        url = f"{self.tv_listings_url}countryCode={country_code}"
-        return self._execute_query(url)
+        return self._execute_query("/tvlistings", {"countryCode": country_code})
 
     def search(self, term: str, user_language: str = "en-GB,en") -> dict:
         """Searches FotMob for a given term
@@ -256,6 +526,6 @@ class MobFot:
         Returns:
             dict: The response from the API
         """
-        search_term = urllib.parse.quote_plus(term)
-        url = f"{self.search_url}term={search_term}&userLanguage={user_language}"
-        return self._execute_query(url)
+        return self._execute_query(
+            "/searchData", {"term": term, "userLanguage": user_language}
+        )
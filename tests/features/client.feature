@@ -4,14 +4,53 @@ Feature: Client usage
     Given there is a MobFot client
     When the "__init__" function is called
     Then the "BASE_URL" attribute equals "https://www.fotmob.com/api"
-    And the "matches_url" attribute equals "https://www.fotmob.com/api/matches?"
-    And the "leagues_url" attribute equals "https://www.fotmob.com/api/leagues?"
-    And the "teams_url" attribute equals "https://www.fotmob.com/api/teams?"
-    And the "player_url" attribute equals "https://www.fotmob.com/api/playerData?"
-    And the "match_details_url" attribute equals "https://www.fotmob.com/api/matchDetails?"
-    And the "search_url" attribute equals "https://www.fotmob.com/api/searchData?"
-    And the "tv_listing_url" attribute equals "https://www.fotmob.com/api/tvlisting?"
-    And the "tv_listings_url" attribute equals "https://www.fotmob.com/api/tvlistings?"
+
+  Scenario: Client pickling
+    Given there is a MobFot client with the proxy "http://127.0.0.1:3128"
+    And match "1" is remembered as "cached"
+    When the client is pickled and unpickled
+    Then the unpickled client uses the proxy "http://127.0.0.1:3128"
+    And the unpickled client has no remembered matches
+    And the unpickled client can parse and memoize responses
+
+  Scenario: HTTP/2 client initialization
+    Given there is an HTTP/2 MobFot client with the proxy "http://127.0.0.1:3128"
+    Then the HTTP/2 session follows redirects and sends the mobfot User-Agent
+    And the HTTP/2 session routes "https" requests through a proxy transport
+
+  Scenario: get_player responses are memoized until the cache is cleared
+    Given there is a MobFot client
+    And the API returns "{}"
+    When "get_player" is called with "525631"
+    And "get_player" is called with "525631"
+    Then the API was queried 1 time
+    When the client cache is cleared
+    And "get_player" is called with "525631"
+    Then the API was queried 2 times
+
+  Scenario: The in-memory match cache forgets the least recently used matches
+    Given there is a MobFot client
+    When 300 finished matches are remembered
+    Then only the last 256 matches are remembered
+
+  Scenario: get_match_details_many maps each match ID to its details
+    Given there is a MobFot client
+    And the API returns unfinished matches
+    And match "1" is remembered as "cached"
+    When get_match_details_many is called with "1,2"
+    Then match "1" is "cached"
+    And match "2" is "fetched"
+    And the API was queried 1 time
+
+  Scenario: get_match_details_many passes no_cache through
+    Given there is a MobFot client
+    And the API returns unfinished matches
+    And match "1" is remembered as "cached"
+    When get_match_details_many is called with "1,2" and no_cache
+    Then match "1" is "fetched"
+    And match "2" is "fetched"
+    And the API was queried 2 times
+    And every API query bypassed the HTTP cache
 
   Scenario: get_matches_by_date
     Given there is a MobFot client
@@ -48,6 +87,11 @@ Feature: Client usage
     When the "_check_date" function is called with the following date "2022-12-05"
     Then the function returns None
 
+  Scenario: Trailing characters after the date for the _check_date function
+    Given there is a MobFot client
+    When the "_check_date" function is called with the following date "202212051"
+    Then the function returns None
+
   Scenario: Valid date format for the _check_season function
     Given there is a MobFot client
     When the "_check_season" function is called with the following date "2021/2022"
@@ -58,6 +102,29 @@ Feature: Client usage
     When the "_check_season" function is called with the following date "2021-2022"
     Then the function returns None
 
+  Scenario: Trailing characters after the season for the _check_season function
+    Given there is a MobFot client
+    When the "_check_season" function is called with the following date "2021/20221"
+    Then the function returns None
+
+  Scenario: Match details are cached under a data path containing %
+    Given there is a MobFot client with the data path "50%done%s"
+    When the "matchDetails" mock is written to the cache for match "1"
+    Then loading match "1" from the cache returns the "matchDetails" mock
+
+  Scenario: A removed data folder is treated as an empty cache
+    Given there is a MobFot client with the data path "removed"
+    And the API returns unfinished matches
+    When the data folder is removed
+    And "get_match_details" is called with "1"
+    Then the API was queried 1 time
+
+  Scenario: A truncated response body raises a requests exception
+    Given there is a MobFot client
+    And the API sends a body shorter than its Content-Length
+    When "get_player" is called with "1" and fails
+    Then the error is a requests exception
+
   Scenario: get_match_tv_listing
     Given there is a MobFot client
     When the "get_match_tv_listing" function is called with parameters "4185410"
@@ -72,3 +139,9 @@ Feature: Client usage
     Given there is a MobFot client
     When the "search" function is called with parameters "neymar"
     Then there is a response
+
+  Scenario: Match details written to the cache can be loaded back
+    Given there is a MobFot client
+    When the "matchDetails" mock is written to the cache for match "1"
+    Then loading match "1" from the cache returns the "matchDetails" mock
+    And the cache file for match "1" has the default file permissions
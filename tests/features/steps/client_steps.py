@@ -1,8 +1,16 @@
 import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
 from re import Match
 
+import requests
 from behave import given, then, when
+from mobfot import MobFot
 
 
 @given("there is a MobFot client")
@@ -10,6 +18,31 @@ def client(context):
     assert context.mobfot is not None
 
 
+@then('the cache file for match "{match_id}" has the default file permissions')
+def cache_file_permissions(context, match_id):
+    umask = os.umask(0)
+    os.umask(umask)
+    mode = os.stat(context.mobfot._parse_filepath(match_id)).st_mode & 0o777
+    assert mode == 0o666 & ~umask, oct(mode)
+
+
+@given('there is a MobFot client with the data path "{name}"')
+def client_with_data_path(context, name):
+    xdg_data = os.path.join(tempfile.mkdtemp(), name)
+    context.add_cleanup(shutil.rmtree, os.path.dirname(xdg_data))
+    previous = os.environ["XDG_DATA_HOME"]
+    os.environ["XDG_DATA_HOME"] = xdg_data
+    try:
+        context.mobfot = MobFot()
+    finally:
+        os.environ["XDG_DATA_HOME"] = previous
+
+
+@when("the data folder is removed")
+def remove_data_folder(context):
+    shutil.rmtree(context.mobfot.DATA_PATH)
+
+
 @when('the "{func_name}" function is called')
 def called(context, func_name):
     pass
@@ -21,6 +54,200 @@ def attribute(context, attr_name, value):
     assert attr == value
 
 
+@when("the client is pickled and unpickled")
+def pickled(context):
+    context.unpickled = pickle.loads(pickle.dumps(context.mobfot))
+
+
+@given('there is a MobFot client with the proxy "{proxy}"')
+def client_with_proxy(context, proxy):
+    context.mobfot = MobFot(proxies={"https": proxy})
+
+
+@given('there is an HTTP/2 MobFot client with the proxy "{proxy}"')
+def http2_client_with_proxy(context, proxy):
+    context.mobfot = MobFot(proxies={"https": proxy}, http2=True)
+    context.add_cleanup(context.mobfot.session.close)
+
+
+@then("the HTTP/2 session follows redirects and sends the mobfot User-Agent")
+def http2_session(context):
+    session = context.mobfot.session
+    assert type(session).__name__ == "Client"
+    assert session.follow_redirects
+    assert session.headers["User-Agent"].startswith("mobfot/")
+
+
+@then('the HTTP/2 session routes "{scheme}" requests through a proxy transport')
+def http2_proxy(context, scheme):
+    transports = {
+        pattern.pattern: transport
+        for pattern, transport in context.mobfot.session._mounts.items()
+    }
+    transport = transports[f"{scheme}://"]
+    assert transport is not None
+    assert transport._pool._proxy_url is not None
+
+
+@then('the unpickled client uses the proxy "{proxy}"')
+def unpickled_proxy(context, proxy):
+    assert context.unpickled.proxies == {"https": proxy}
+    assert context.unpickled.http2 is False
+    assert context.unpickled.session.proxies == {"https": proxy}
+    assert context.unpickled.DATA_PATH == context.mobfot.DATA_PATH
+
+
+@then("the unpickled client has no remembered matches")
+def unpickled_matches(context):
+    assert not context.unpickled._match_cache
+    assert context.mobfot._match_cache
+
+
+@then("the unpickled client can parse and memoize responses")
+def unpickled_caches(context):
+    fetched = []
+
+    def fetch(path, params, headers=None):
+        fetched.append(params)
+        return b'{"id": 1}'
+
+    context.unpickled._fetch = fetch
+    assert context.unpickled.get_player(1) == {"id": 1}
+    assert context.unpickled.get_player(1) == {"id": 1}
+    assert fetched == [{"id": 1}]
+
+
+@given('the API returns "{body}"')
+def stub_api(context, body):
+    context.fetched = []
+
+    def fetch(path, params, **kwargs):
+        context.fetched.append((path, params))
+        return body.encode()
+
+    context.mobfot._fetch = fetch
+    context.add_cleanup(context.mobfot.clear_cache)
+    context.add_cleanup(delattr, context.mobfot, "_fetch")
+
+
+@given("the API returns unfinished matches")
+def stub_matches(context):
+    context.fetched = []
+    context.headers = []
+
+    def fetch(path, params, headers=None):
+        context.fetched.append((path, params))
+        context.headers.append(headers)
+        status = {"started": True, "finished": False}
+        match = {
+            "matchId": params["matchId"],
+            "source": "fetched",
+            "header": {"status": status},
+        }
+        return json.dumps(match).encode()
+
+    context.mobfot._fetch = fetch
+    context.add_cleanup(context.mobfot.clear_cache)
+    context.add_cleanup(delattr, context.mobfot, "_fetch")
+
+
+@then("every API query bypassed the HTTP cache")
+def bypassed_http_cache(context):
+    assert context.headers
+    assert all(h == {"Cache-Control": "no-cache"} for h in context.headers)
+
+
+@given('match "{match_id:d}" is remembered as "{source}"')
+def remember_match(context, match_id, source):
+    context.mobfot._remember_match(match_id, {"matchId": match_id, "source": source})
+
+
+@when('get_match_details_many is called with "{match_ids}"')
+def many(context, match_ids):
+    ids = [int(match_id) for match_id in match_ids.split(",")]
+    context.response = context.mobfot.get_match_details_many(ids)
+
+
+@when('get_match_details_many is called with "{match_ids}" and no_cache')
+def many_no_cache(context, match_ids):
+    ids = [int(match_id) for match_id in match_ids.split(",")]
+    context.response = context.mobfot.get_match_details_many(ids, no_cache=True)
+
+
+@then('match "{match_id:d}" is "{source}"')
+def match_source(context, match_id, source):
+    match = context.response[match_id]
+    assert match["matchId"] == match_id
+    assert match["source"] == source
+
+
+class TruncatedBodyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "1000")
+        self.end_headers()
+        self.wfile.write(b'{"id": ')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@given("the API sends a body shorter than its Content-Length")
+def truncated_api(context):
+    server = HTTPServer(("127.0.0.1", 0), TruncatedBodyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    context.add_cleanup(server.server_close)
+    context.add_cleanup(server.shutdown)
+    context.add_cleanup(context.mobfot.clear_cache)
+    context.mobfot.BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    context.add_cleanup(delattr, context.mobfot, "BASE_URL")
+
+
+@when('"{func_name}" is called with "{param}" and fails')
+def failing_call(context, func_name, param):
+    try:
+        getattr(context.mobfot, func_name)(param)
+    except Exception as e:
+        context.error = e
+    else:
+        context.error = None
+
+
+@then("the error is a requests exception")
+def requests_error(context):
+    assert isinstance(context.error, requests.RequestException), repr(context.error)
+
+
+@when('"{func_name}" is called with "{param}"')
+def stubbed_call(context, func_name, param):
+    context.response = getattr(context.mobfot, func_name)(param)
+
+
+@when("the client cache is cleared")
+def clear_cache(context):
+    context.mobfot.clear_cache()
+
+
+@then("the API was queried {count:d} time")
+@then("the API was queried {count:d} times")
+def queried(context, count):
+    assert len(context.fetched) == count, context.fetched
+
+
+@when("{count:d} finished matches are remembered")
+def remember_matches(context, count):
+    context.add_cleanup(context.mobfot.clear_cache)
+    context.remembered = count
+    for match_id in range(count):
+        context.mobfot._remember_match(match_id, {"matchId": match_id})
+
+
+@then("only the last {count:d} matches are remembered")
+def remembered_matches(context, count):
+    total = context.remembered
+    assert list(context.mobfot._match_cache) == list(range(total - count, total))
+
+
 @when('the "{func_name}" function is called with parameters "{params}"')
 def function_call(context, func_name, params):
     cwd = Path.cwd()
@@ -58,3 +285,17 @@ def matched_date(context):
 @then("the function returns None")
 def matched_date(context):
     assert context.date == None
+
+
+@when('the "{mock}" mock is written to the cache for match "{match_id}"')
+def write_to_cache(context, mock, match_id):
+    filepath = context.mobfot._parse_filepath(match_id)
+    context.mobfot._write_file(filepath, Path(f"./mocks/{mock}.json").read_bytes())
+    context.add_cleanup(os.remove, filepath)
+
+
+@then('loading match "{match_id}" from the cache returns the "{mock}" mock')
+def load_from_cache(context, match_id, mock):
+    filepath = context.mobfot._parse_filepath(match_id)
+    cached = context.mobfot._load_if_file_exist(filepath)
+    assert cached == json.load(Path(f"./mocks/{mock}.json").open())